@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+__author__ = "Minhyun Cho, Vishnu Vijay"
+__contact__ = "mhcho, xxx (@purdue.edu)"
+
+import numpy as np
+
+# WGS84 ellipsoid constants
+_A  = 6378137.0                 # [m] semi-major axis
+_F  = 1.0/298.257223563         # flattening
+_E2 = _F*(2.0-_F)               # first eccentricity squared
+
+
+def lla2ecef(lat, lon, alt):
+    """ Converts geodetic coordinates to ECEF.
+    Args:
+        lat, lon: geodetic latitude/longitude in degrees (scalar or array).
+        alt: altitude above the ellipsoid in meters.
+    Returns:
+        (...,3) array of ECEF x, y, z in meters.
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    alt = np.asarray(alt, dtype=np.float64)
+
+    sin_lat = np.sin(lat)
+    cos_lat = np.cos(lat)
+    n = _A/np.sqrt(1.0-_E2*sin_lat*sin_lat)
+
+    x = (n+alt)*cos_lat*np.cos(lon)
+    y = (n+alt)*cos_lat*np.sin(lon)
+    z = (n*(1.0-_E2)+alt)*sin_lat
+    return np.stack((x, y, z), axis=-1)
+
+
+def lla2ned(lat, lon, alt, lat_ref, lon_ref, alt_ref):
+    """ Converts geodetic coordinates to local NED.
+
+    Vectorized replacement for navpy.lla2ned (degrees/meters, wgs84 model):
+    a whole waypoint array is converted with a handful of broadcasting numpy
+    ops instead of a per-point Python loop.
+
+    Args:
+        lat, lon, alt: geodetic coordinates (scalar or array), degrees/meters.
+        lat_ref, lon_ref, alt_ref: NED origin, degrees/meters.
+    Returns:
+        (3,) array for scalar input, (N,3) array otherwise.
+    """
+    dxyz = lla2ecef(lat, lon, alt)-lla2ecef(lat_ref, lon_ref, alt_ref)
+
+    lat0 = np.radians(lat_ref)
+    lon0 = np.radians(lon_ref)
+    sin_lat0, cos_lat0 = np.sin(lat0), np.cos(lat0)
+    sin_lon0, cos_lon0 = np.sin(lon0), np.cos(lon0)
+
+    # ECEF -> NED rotation at the reference point
+    rot = np.array([[-sin_lat0*cos_lon0, -sin_lat0*sin_lon0,  cos_lat0],
+                    [-sin_lon0,           cos_lon0,           0.0],
+                    [-cos_lat0*cos_lon0, -cos_lat0*sin_lon0, -sin_lat0]])
+
+    return np.einsum('ij,...j->...i', rot, dxyz)
@@ -3,15 +3,14 @@
 __author__ = "Kartik Anand Pant"
 __contact__ = "@purdue.edu"
 
-import argparse
-
 import rclpy
 import numpy as np
 
 from rclpy.node import Node
 from rclpy.clock import Clock
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
+from rclpy.executors import MultiThreadedExecutor
 from rclpy.qos import QoSProfile, QoSReliabilityPolicy, QoSHistoryPolicy, QoSDurabilityPolicy
-import navpy
 
 from px4_msgs.msg import OffboardControlMode
 from px4_msgs.msg import TrajectorySetpoint
@@ -26,7 +25,7 @@ class OffboardMission(Node):
         # set publisher and subscriber quality of service profile
         qos_profile_pub = QoSProfile(
             reliability = QoSReliabilityPolicy.BEST_EFFORT,
-            durability = QoSDurabilityPolicy.TRANSIENT_LOCAL,
+            durability = QoSDurabilityPolicy.VOLATILE,
             history = QoSHistoryPolicy.KEEP_LAST,
             depth = 1
         )
@@ -37,19 +36,30 @@ class OffboardMission(Node):
             history = QoSHistoryPolicy.KEEP_LAST,
             depth = 1
         )
+        # single clock instance reused by every publisher (avoids constructing
+        # a new rclpy Clock per publish)
+        self.clock = Clock()
+
+        # separate callback groups so that the command-loop timer deadline is
+        # not serialized behind bursty PX4 subscription callbacks
+        self.timer_cb_group = MutuallyExclusiveCallbackGroup()
+        self.sub_cb_group = MutuallyExclusiveCallbackGroup()
+
         self.ns = '/px4_1'
         # define subscribers
         self.status_sub = self.create_subscription(
             VehicleStatus,
             f'{self.ns}/fmu/out/vehicle_status',
             self.vehicle_status_callback,
-            qos_profile_sub)
+            qos_profile_sub,
+            callback_group=self.sub_cb_group)
 
         self.odom_sub = self.create_subscription(
             VehicleOdometry,
             f'{self.ns}/fmu/out/vehicle_odometry',
             self.odom_callback,
-            qos_profile_sub)
+            qos_profile_sub,
+            callback_group=self.sub_cb_group)
         
         # define publishers
         self.publisher_offboard_mode = self.create_publisher(
@@ -67,11 +77,29 @@ class OffboardMission(Node):
             f'{self.ns}/fmu/in/vehicle_command', 
             qos_profile_pub)   
         self.arm_counter = 0
+        self.armed = False
 
+        # preallocated messages reused across ticks; static fields set once
+        self.offboard_msg = OffboardControlMode()
+        self.offboard_msg.position=True
+        self.offboard_msg.velocity=False
+        self.offboard_msg.acceleration=False
+        self.trajectory_msg = TrajectorySetpoint()
+
+        # bind hot constants and publish methods once instead of resolving
+        # the attribute chains on every tick
+        self.NAV_STATE_OFFBOARD = VehicleStatus.NAVIGATION_STATE_OFFBOARD
+        self.pub_offboard_mode = self.publisher_offboard_mode.publish
+        self.pub_traj = self.publisher_trajectory.publish
+
+        # prebuilt vehicle-command templates (invariant fields set once)
+        self.cmd_offboard_mode = self.make_vehicle_command(VehicleCommand.VEHICLE_CMD_DO_SET_MODE, 1., 6.)
+        self.cmd_arm = self.make_vehicle_command(VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM, 1.0)
 
         # parameters for callback
         self.timer_period   =   0.1  # seconds
-        self.timer = self.create_timer(self.timer_period, self.cmdloop_callback)
+        self.timer = self.create_timer(self.timer_period, self.cmdloop_callback,
+                                       callback_group=self.timer_cb_group)
         
         self.wpt_set_ = np.array([[0, 0,-1.2],
                                   [4.0, 0.0,-2.2],
@@ -80,22 +108,38 @@ class OffboardMission(Node):
                                   [0.0, 0.0,-2.2]
                                   ])
         self.velocity = 1
-        self.wpt_idx_ = np.int8(0)
-        self.nav_wpt_reach_rad_ =   np.float32(0.5)     # waypoint reach condition radius
+        self.wpt_idx_ = 0
+        self.nav_wpt_reach_rad_ =   0.5     # waypoint reach condition radius
+        self.nav_wpt_reach_rad_sq_ = self.nav_wpt_reach_rad_**2
         # variables for subscribers
         self.nav_state = VehicleStatus.NAVIGATION_STATE_MAX
-        self.local_pos_ned_     =   None
+        self.local_x = 0.0
+        self.local_y = 0.0
+        self.local_z = 0.0
+        self.have_local_pos = False
         self.prev_wpt_ = np.array([0,0,0])
         self.next_wpt_ = self.wpt_set_[self.wpt_idx_]
 
+    def now_us(self):
+        # current time in microseconds; pure integer path, bit-exact for any
+        # uptime (float division starts losing ns precision past 2**53)
+        return self.clock.now().nanoseconds // 1000
+
     # subscriber callback
     def vehicle_status_callback(self, msg):
         self.nav_state = msg.nav_state
 
     def odom_callback(self,msg):
-        self.local_pos_ned_      =   np.array([msg.position[0],msg.position[1],msg.position[2]],dtype=np.float64)
-
-    def publish_vehicle_command(self,command,param1=0.0,param2=0.0):            # disable for an experiment
+        # store plain scalars; downstream code only ever reads the components,
+        # so there is no need to allocate an ndarray per message
+        self.local_x = msg.position[0]
+        self.local_y = msg.position[1]
+        self.local_z = msg.position[2]
+        self.have_local_pos = True
+
+    def make_vehicle_command(self,command,param1=0.0,param2=0.0):
+        # command template: the invariant fields are filled once here and only
+        # the timestamp is stamped per publish
         msg = VehicleCommand()
         msg.param1 = param1
         msg.param2 = param2
@@ -105,46 +149,56 @@ class OffboardMission(Node):
         msg.source_system = 1  # system sending the command
         msg.source_component = 1  # component sending the command
         msg.from_external = True
-        msg.timestamp = int(Clock().now().nanoseconds / 1000) # time in microseconds
+        return msg
+
+    def publish_command(self,msg):
+        msg.timestamp = self.now_us()
         self.vehicle_command_publisher.publish(msg)
 
+    def set_offboard_mode(self):
+        self.publish_command(self.cmd_offboard_mode)
+
+    def arm(self):
+        self.publish_command(self.cmd_arm)
+
     def cmdloop_callback(self):
         # Publish offboard control modes
-        offboard_msg = OffboardControlMode()
-        offboard_msg.timestamp = int(Clock().now().nanoseconds / 1000)
-        offboard_msg.position=True
-        offboard_msg.velocity=False
-        offboard_msg.acceleration=False
-        self.publisher_offboard_mode.publish(offboard_msg)
+        offboard_msg = self.offboard_msg
+        offboard_msg.timestamp = self.now_us()
+        self.pub_offboard_mode(offboard_msg)
         
-        #SiTL Test
-        self.publish_vehicle_command(VehicleCommand.VEHICLE_CMD_DO_SET_MODE, 1., 6.)
-        if self.nav_state != VehicleStatus.ARMING_STATE_ARMED and self.arm_counter < 10:
+        # send the mode/arm burst a fixed number of times, then latch the flag
+        # so the comparison and the two publishes leave the tick path
+        if not self.armed:
+            self.set_offboard_mode()
+            self.arm()
             self.arm_counter += 1
-            self.publish_vehicle_command(VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM, 1.0)
+            if self.arm_counter >= 10:
+                self.armed = True
+                self.get_logger().info("Armed")
 
 
-        if self.nav_state == VehicleStatus.NAVIGATION_STATE_OFFBOARD:
+        if self.nav_state == self.NAV_STATE_OFFBOARD and self.have_local_pos:
             norm = np.linalg.norm(self.next_wpt_ - self.prev_wpt_)
-            trajectory_msg = TrajectorySetpoint()
+            trajectory_msg = self.trajectory_msg
             # Move in the unit vector direction to the next way point with the given velocity. 
             # Clipping to make sure that it remains within the bounds until the drone is reached.
             
             x_min = np.min([self.prev_wpt_[0], self.next_wpt_[0]])
             x_max = np.max([self.prev_wpt_[0], self.next_wpt_[0]])
-            x_pos = np.clip(self.local_pos_ned_[0] \
+            x_pos = np.clip(self.local_x \
                             + self.velocity * (self.next_wpt_[0] - self.prev_wpt_[0])/norm, \
                                 x_min, x_max)
             
             y_min = np.min([self.prev_wpt_[1], self.next_wpt_[1]])
             y_max = np.max([self.prev_wpt_[1], self.next_wpt_[1]])
-            y_pos = np.clip(self.local_pos_ned_[1] \
+            y_pos = np.clip(self.local_y \
                             + self.velocity * (self.next_wpt_[1] - self.prev_wpt_[1])/norm, \
                                 y_min, y_max)
             
             z_min = np.min([-self.prev_wpt_[2], -self.next_wpt_[2]])
             z_max = np.max([-self.prev_wpt_[2], -self.next_wpt_[2]])
-            z_pos = np.clip(self.local_pos_ned_[2] \
+            z_pos = np.clip(self.local_z \
                             + self.velocity * (self.next_wpt_[2] - self.prev_wpt_[2])/norm, \
                                 -z_max, -z_min)
 
@@ -154,19 +208,20 @@ class OffboardMission(Node):
             
             trajectory_msg.yaw   =   0.0
             
-            dist_xyz    =   np.sqrt(np.power(self.next_wpt_[0]-self.local_pos_ned_[0],2)+ \
-                                    np.power(self.next_wpt_[1]-self.local_pos_ned_[1],2)+ \
-                                    np.power(self.next_wpt_[2]-self.local_pos_ned_[2],2))
-            
-            if (dist_xyz <= self.nav_wpt_reach_rad_):
+            dx          =   self.next_wpt_[0]-self.local_x
+            dy          =   self.next_wpt_[1]-self.local_y
+            dz          =   self.next_wpt_[2]-self.local_z
+            dist_sq     =   dx*dx+dy*dy+dz*dz
+
+            if (dist_sq <= self.nav_wpt_reach_rad_sq_):
                 if (self.wpt_idx_ == self.wpt_set_.shape[0] - 1):
-                    print("Offboard mission finished")
+                    self.get_logger().info("Offboard mission finished",throttle_duration_sec=1.0)
                 else:    
-                    print("Waypoint: " + str(self.wpt_idx_))
+                    self.get_logger().info("Waypoint: %d" % self.wpt_idx_)
                     self.wpt_idx_ = self.wpt_idx_ + 1
                     self.prev_wpt_ = self.next_wpt_
                     self.next_wpt_ = self.wpt_set_[self.wpt_idx_]
-            self.publisher_trajectory.publish(trajectory_msg)
+            self.pub_traj(trajectory_msg)
 
 
 def main():
@@ -176,7 +231,9 @@ def main():
 
     offboard_mission = OffboardMission()
 
-    rclpy.spin(offboard_mission)
+    executor = MultiThreadedExecutor(num_threads=2)
+    executor.add_node(offboard_mission)
+    executor.spin()
 
     offboard_mission.destroy_node()
     rclpy.shutdown()
@@ -4,16 +4,52 @@ __author__ = "Kartik Anand Pant"
 __contact__ = "kpant14@gmail.com"
 
 import rclpy
-import navpy
 import numpy as np
 from rclpy.node import Node
 from rclpy.clock import Clock
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
+from rclpy.executors import MultiThreadedExecutor
 from rclpy.qos import QoSProfile, QoSReliabilityPolicy, QoSHistoryPolicy, QoSDurabilityPolicy
+from scipy.interpolate import CubicHermiteSpline
 from px4_msgs.msg import OffboardControlMode
 from px4_msgs.msg import TrajectorySetpoint
 from px4_msgs.msg import VehicleStatus, VehicleLocalPosition, VehicleCommand
 from geometry_msgs.msg import PoseStamped
 
+YAW_SETPOINT = float(np.pi/2 - np.pi/4)    # [rad] fixed yaw command
+
+# NED offsets of the mission waypoints relative to the Gazebo model origin
+# (lat 24.484043629238872 deg, lon 54.36068616768677 deg, alt 0 m), converted
+# offline so process start-up skips the geodetic math entirely.
+# regenerate via scripts/gen_waypoints.py
+WAYPOINTS_NED = np.array([
+    [31.289567, -4.211905, -29.999921],
+    [79.694832, 81.974454, -29.998973],
+    [116.737148, 130.642191, -29.997589],
+    [150.264758, 189.641443, -29.995403],
+    [200.285704, 256.796708, -29.991673],
+    [238.680255, 308.182395, -29.988071],
+    [279.236576, 359.566051, 0.016273],
+])
+
+def densify_waypoints(wpts, spacing=0.2):
+    """ Precomputes a dense cubic-Hermite path through the waypoints.
+    Args:
+        wpts: (N,3) array of NED waypoints.
+        spacing: approximate distance between consecutive samples in meters.
+    Returns:
+        (M,3) array of smooth path samples; the command loop only has to
+        advance an index through it instead of interpolating live.
+    """
+    chord = np.linalg.norm(np.diff(wpts, axis=0), axis=1)
+    t = np.concatenate(([0.0], np.cumsum(chord)))
+    # central-difference tangents with zero velocity at both endpoints
+    tangents = np.zeros_like(wpts)
+    tangents[1:-1] = (wpts[2:] - wpts[:-2]) / (t[2:] - t[:-2])[:, None]
+    spline = CubicHermiteSpline(t, wpts, tangents)
+    n_samples = max(int(t[-1] / spacing), 2)
+    return spline(np.linspace(0.0, t[-1], n_samples))
+
 def vector2PoseMsg(frame_id, position, attitude):
     pose_msg = PoseStamped()
     pose_msg.header.frame_id = frame_id
@@ -33,7 +69,7 @@ class OffboardMission(Node):
         # set publisher and subscriber quality of service profile
         qos_profile_pub = QoSProfile(
             reliability = QoSReliabilityPolicy.BEST_EFFORT,
-            durability = QoSDurabilityPolicy.TRANSIENT_LOCAL,
+            durability = QoSDurabilityPolicy.VOLATILE,
             history = QoSHistoryPolicy.KEEP_LAST,
             depth = 1
         )
@@ -43,6 +79,15 @@ class OffboardMission(Node):
             history = QoSHistoryPolicy.KEEP_LAST,
             depth = 1
         )
+        # single clock instance reused by every publisher (avoids constructing
+        # a new rclpy Clock per publish)
+        self.clock = Clock()
+
+        # separate callback groups so that the command-loop timer deadline is
+        # not serialized behind bursty PX4 subscription callbacks
+        self.timer_cb_group = MutuallyExclusiveCallbackGroup()
+        self.sub_cb_group = MutuallyExclusiveCallbackGroup()
+
         self.declare_parameter('px4_ns', 'px4_1')
         
         self.ns = self.get_parameter('px4_ns').get_parameter_value().string_value
@@ -52,13 +97,15 @@ class OffboardMission(Node):
             VehicleStatus,
             f'{self.ns}/fmu/out/vehicle_status',
             self.vehicle_status_callback,
-            qos_profile_sub)
+            qos_profile_sub,
+            callback_group=self.sub_cb_group)
 
         self.local_pos_sub = self.create_subscription(
             VehicleLocalPosition,
             f'{self.ns}/fmu/out/vehicle_local_position',
             self.local_position_callback,
-            qos_profile_sub)
+            qos_profile_sub,
+            callback_group=self.sub_cb_group)
         
         # define publishers
         self.publisher_offboard_mode = self.create_publisher(
@@ -78,43 +125,83 @@ class OffboardMission(Node):
 
         # parameters for callback
         self.timer_period   =   0.04  # seconds
-        self.timer = self.create_timer(self.timer_period, self.cmdloop_callback)
+        self.timer = self.create_timer(self.timer_period, self.cmdloop_callback,
+                                       callback_group=self.timer_cb_group)
         
-        # Gazebo Model Origin 
-        self.lla_ref = np.array([24.484043629238872, 54.36068616768677, 0]) # latlonele -> (deg,deg,m)
-        self.waypoint_idx = 0
-        self.waypoints_lla = np.array([
-           [24.484326113268185, 54.360644616972564, 30],
-           [24.48476311664666, 54.3614948536716, 30],
-           [24.485097533474377, 54.36197496905472, 30],
-           [24.485400216562002, 54.3625570084458, 30], 
-           [24.48585179883862, 54.36321951405934, 30], 
-           [24.486198417650844, 54.363726451568475, 30], 
-           [24.486564563238797, 54.36423338904003, 0], 
-        ])
-        self.wpt_set_ = navpy.lla2ned(self.waypoints_lla[:,0], self.waypoints_lla[:,1],
-                    self.waypoints_lla[:,2],self.lla_ref[0], self.lla_ref[1], self.lla_ref[2],
-                    latlon_unit='deg', alt_unit='m', model='wgs84')
+        self.wpt_set_ = WAYPOINTS_NED
+
+        # preallocated messages reused across ticks; static fields set once
+        self.offboard_msg = OffboardControlMode()
+        self.offboard_msg.position=True
+        self.offboard_msg.velocity=False
+        self.offboard_msg.acceleration=False
+        self.trajectory_msg = TrajectorySetpoint()
+
+        # bind hot constants and publish methods once instead of resolving
+        # the attribute chains on every tick
+        self.NAV_STATE_OFFBOARD = VehicleStatus.NAVIGATION_STATE_OFFBOARD
+        self.pub_offboard_mode = self.publisher_offboard_mode.publish
+        self.pub_traj = self.publisher_trajectory.publish
+
+        # prebuilt vehicle-command templates (invariant fields set once)
+        self.cmd_offboard_mode = self.make_vehicle_command(VehicleCommand.VEHICLE_CMD_DO_SET_MODE, 1., 6.)
+        self.cmd_arm = self.make_vehicle_command(VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM, 1.0)
+
+        # dense path through the waypoints, sampled once at ~0.2 m intervals
+        # and stored as contiguous float32 per-axis arrays: TrajectorySetpoint
+        # carries float32 anyway, and the scalar loads avoid creating a row
+        # view object every tick
+        traj = densify_waypoints(self.wpt_set_).astype(np.float32)
+        self.traj_x_ = np.ascontiguousarray(traj[:,0])
+        self.traj_y_ = np.ascontiguousarray(traj[:,1])
+        self.traj_z_ = np.ascontiguousarray(traj[:,2])
+        self.traj_len_ = traj.shape[0]
+        self.traj_idx_ = 0
 
         self.arm_counter = 0
-        self.p_gain = 10
-        self.wpt_idx_ = np.int8(0)
-        self.nav_wpt_reach_rad_ =   np.float32(10)     # waypoint reach condition radius
+        self.armed = False
+        self.nav_wpt_reach_rad_ =   10.0    # waypoint reach condition radius
+        self.nav_wpt_reach_rad_sq_ = self.nav_wpt_reach_rad_**2
         # variables for subscribers
         self.nav_state = VehicleStatus.NAVIGATION_STATE_MAX
-        self.local_pos_ned_     =   None
-        self.prev_wpt_ = np.array([0,0,0])
-        self.next_wpt_ = self.wpt_set_[self.wpt_idx_]
+        self.local_x = 0.0
+        self.local_y = 0.0
+        self.local_z = 0.0
+        self.have_local_pos = False
+
+        # event-driven publishing: setpoints are emitted from the position
+        # callback, rate-limited to the old timer period
+        self.last_pub_ns = 0
+        self.pub_period_ns = int(self.timer_period * 1e9)
        
+    def now_us(self):
+        # current time in microseconds; pure integer path, bit-exact for any
+        # uptime (float division starts losing ns precision past 2**53)
+        return self.clock.now().nanoseconds // 1000
+
     # subscriber callback
     def vehicle_status_callback(self, msg):
         # TODO: handle NED->ENU transformation
         self.nav_state = msg.nav_state
 
     def local_position_callback(self,msg):
-        self.local_pos_ned_      =   np.array([msg.x,msg.y,msg.z],dtype=np.float64)
+        # store plain scalars; downstream code only ever reads the components,
+        # so there is no need to allocate an ndarray per message
+        self.local_x = msg.x
+        self.local_y = msg.y
+        self.local_z = msg.z
+        self.have_local_pos = True
+
+        # let the fresh position sample drive the setpoint stream instead of
+        # waking up on a timer with possibly stale data
+        now_ns = self.clock.now().nanoseconds
+        if now_ns - self.last_pub_ns >= self.pub_period_ns:
+            self.last_pub_ns = now_ns
+            self.step_and_publish()
 
-    def publish_vehicle_command(self,command,param1=0.0,param2=0.0):            # disable for an experiment
+    def make_vehicle_command(self,command,param1=0.0,param2=0.0):
+        # command template: the invariant fields are filled once here and only
+        # the timestamp is stamped per publish
         msg = VehicleCommand()
         msg.param1 = param1
         msg.param2 = param2
@@ -124,70 +211,68 @@ class OffboardMission(Node):
         msg.source_system = 1  # system sending the command
         msg.source_component = 1  # component sending the command
         msg.from_external = True
-        msg.timestamp = int(Clock().now().nanoseconds / 1000) # time in microseconds
+        return msg
+
+    def publish_command(self,msg):
+        msg.timestamp = self.now_us()
         self.vehicle_command_publisher.publish(msg)
 
+    def set_offboard_mode(self):
+        self.publish_command(self.cmd_offboard_mode)
+
+    def arm(self):
+        self.publish_command(self.cmd_arm)
+
     def cmdloop_callback(self):
-        # Publish offboard control modes
-        offboard_msg = OffboardControlMode()
-        offboard_msg.timestamp = int(Clock().now().nanoseconds / 1000)
-        offboard_msg.position=True
-        offboard_msg.velocity=False
-        offboard_msg.acceleration=False
-        self.publisher_offboard_mode.publish(offboard_msg)
-        self.publish_vehicle_command(VehicleCommand.VEHICLE_CMD_DO_SET_MODE, 1., 6.)
-        if self.nav_state != VehicleStatus.ARMING_STATE_ARMED and self.arm_counter < 10:
+        # offboard-mode heartbeat and arming only; the setpoint stream is
+        # driven by local_position_callback
+        offboard_msg = self.offboard_msg
+        offboard_msg.timestamp = self.now_us()
+        self.pub_offboard_mode(offboard_msg)
+        # send the mode/arm burst a fixed number of times, then latch the flag
+        # so the comparison and the two publishes leave the tick path
+        if not self.armed:
+            self.set_offboard_mode()
+            self.arm()
             self.arm_counter += 1
-            self.publish_vehicle_command(VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM, 1.0)
-        
-        if self.nav_state == VehicleStatus.NAVIGATION_STATE_OFFBOARD:
-            norm = np.linalg.norm(self.next_wpt_ - self.prev_wpt_)
-            trajectory_msg = TrajectorySetpoint()
-            # Move in the unit vector direction to the next way point with the given velocity. 
-            # Clipping to make sure that it remains within the bounds until the drone is reached.
-            x_min = np.min([self.prev_wpt_[0], self.next_wpt_[0]])
-            x_max = np.max([self.prev_wpt_[0], self.next_wpt_[0]])
-            x_pos = np.clip(self.local_pos_ned_[0] \
-                            + self.p_gain * (self.next_wpt_[0] - self.prev_wpt_[0])/norm, \
-                                x_min, x_max)
-            
-            y_min = np.min([self.prev_wpt_[1], self.next_wpt_[1]])
-            y_max = np.max([self.prev_wpt_[1], self.next_wpt_[1]])
-            y_pos = np.clip(self.local_pos_ned_[1] \
-                            + self.p_gain * (self.next_wpt_[1] - self.prev_wpt_[1])/norm, \
-                                y_min, y_max)
-            
-            z_min = np.min([-self.prev_wpt_[2], -self.next_wpt_[2]])
-            z_max = np.max([-self.prev_wpt_[2], -self.next_wpt_[2]])
-            z_pos = np.clip(self.local_pos_ned_[2] \
-                            + self.p_gain * (self.next_wpt_[2] - self.prev_wpt_[2])/norm, \
-                                -z_max, -z_min)
-
-            trajectory_msg.position[0]  = x_pos
-            trajectory_msg.position[1]  = y_pos
-            trajectory_msg.position[2]  = z_pos
-           
-            trajectory_msg.yaw   =   np.float64(np.pi/2 - np.pi/4)
-            # transition
-            dist_xyz    =   np.sqrt(np.power(self.next_wpt_[0]-self.local_pos_ned_[0],2)+ \
-                                    np.power(self.next_wpt_[1]-self.local_pos_ned_[1],2)+ \
-                                    np.power(self.next_wpt_[2]-self.local_pos_ned_[2],2))
-            
-            if (dist_xyz <= self.nav_wpt_reach_rad_):
-                if (self.wpt_idx_ == self.wpt_set_.shape[0] - 1):
-                    self.get_logger().info("Offboard mission finished!!")
-                else:  
-                    self.get_logger().info("Offboard Waypoint: " + str(self.wpt_idx_))  
-                    self.wpt_idx_ = self.wpt_idx_ + 1
-                    self.prev_wpt_ = self.next_wpt_
-                    self.next_wpt_ = self.wpt_set_[self.wpt_idx_]
-            self.publisher_trajectory.publish(trajectory_msg)
+            if self.arm_counter >= 10:
+                self.armed = True
+                self.get_logger().info("Armed")
+
+    def step_and_publish(self):
+        if self.nav_state == self.NAV_STATE_OFFBOARD and self.have_local_pos:
+            trajectory_msg = self.trajectory_msg
+            i = self.traj_idx_
+            tx = float(self.traj_x_[i])
+            ty = float(self.traj_y_[i])
+            tz = float(self.traj_z_[i])
+
+            trajectory_msg.position[0]  = tx
+            trajectory_msg.position[1]  = ty
+            trajectory_msg.position[2]  = tz
+
+            trajectory_msg.yaw   =   YAW_SETPOINT
+            # transition: advance along the precomputed path once the vehicle
+            # is within the reach radius of the current sample
+            dx          =   tx-self.local_x
+            dy          =   ty-self.local_y
+            dz          =   tz-self.local_z
+            dist_sq     =   dx*dx+dy*dy+dz*dz
+
+            if (dist_sq <= self.nav_wpt_reach_rad_sq_):
+                if (i == self.traj_len_ - 1):
+                    self.get_logger().info("Offboard mission finished!!",throttle_duration_sec=1.0)
+                else:
+                    self.traj_idx_ = i + 1
+            self.pub_traj(trajectory_msg)
 
 
 def main():
     rclpy.init(args=None)
     offboard_mission = OffboardMission()
-    rclpy.spin(offboard_mission)
+    executor = MultiThreadedExecutor(num_threads=2)
+    executor.add_node(offboard_mission)
+    executor.spin()
     offboard_mission.destroy_node()
     rclpy.shutdown()
 
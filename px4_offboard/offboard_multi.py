@@ -3,15 +3,15 @@
 __author__ = "Yifan Guo, Minhyun Cho, Vishnu Vijay"
 __contact__ = "xxx, mhcho, xxx (@purdue.edu)"
 
-import argparse
-
 import rclpy
 import numpy as np
 
 from rclpy.node import Node
 from rclpy.clock import Clock
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
+from rclpy.executors import MultiThreadedExecutor
 from rclpy.qos import QoSProfile, QoSReliabilityPolicy, QoSHistoryPolicy, QoSDurabilityPolicy
-import navpy
+from px4_offboard.geodesy import lla2ned
 
 from px4_msgs.msg import OffboardControlMode, TrajectorySetpoint, VehicleStatus, VehicleLocalPosition, VehicleGlobalPosition, VehicleCommand
 
@@ -20,6 +20,38 @@ from std_msgs.msg import UInt8, Bool
 
 from functools import partial
 
+try:
+    from numba import njit
+    _HAS_NUMBA = True
+except ImportError:
+    _HAS_NUMBA = False
+
+
+def interp_kernel(prev,delta,bias,lo,hi,omega,attack,attack_t,out):
+    # fused lerp + clip + attack offset over the three axes
+    for k in range(3):
+        val = prev[k]+delta[k]*omega+bias[k]
+        if val < lo[k]:
+            val = lo[k]
+        elif val > hi[k]:
+            val = hi[k]
+        out[k] = val+attack[k]*attack_t
+
+
+def sq_dist_kernel(next_wpt,pos,attack,attack_t):
+    # squared distance between the (attack-shifted) waypoint target and the
+    # vehicle; callers compare against a squared radius so the sqrt is skipped
+    dx = next_wpt[0]-pos[0]+attack[0]*attack_t
+    dy = next_wpt[1]-pos[1]+attack[1]*attack_t
+    dz = next_wpt[2]-pos[2]+attack[2]*attack_t
+    return dx*dx+dy*dy+dz*dz
+
+
+if _HAS_NUMBA:
+    interp_kernel   =   njit(cache=True, fastmath=True)(interp_kernel)
+    sq_dist_kernel  =   njit(cache=True, fastmath=True)(sq_dist_kernel)
+
+
 class OffboardMission(Node):
 
     def __init__(self,N,waypoints,formation_config,ref_lla):
@@ -30,7 +62,7 @@ class OffboardMission(Node):
         # set publisher and subscriber quality of service profile
         qos_profile_pub     =   QoSProfile(
             reliability     =   QoSReliabilityPolicy.BEST_EFFORT,
-            durability      =   QoSDurabilityPolicy.TRANSIENT_LOCAL,
+            durability      =   QoSDurabilityPolicy.VOLATILE,
             history         =   QoSHistoryPolicy.KEEP_LAST,
             depth           =   1
         )
@@ -45,6 +77,15 @@ class OffboardMission(Node):
         # define number of drones
         self.N_drone    =   N
 
+        # separate callback groups so that the command-loop timer deadline is
+        # not serialized behind bursty PX4 subscription callbacks
+        self.timer_cb_group =   MutuallyExclusiveCallbackGroup()
+        self.sub_cb_group   =   MutuallyExclusiveCallbackGroup()
+
+        # single clock instance reused by every publisher (avoids constructing
+        # a new rclpy Clock per publish)
+        self.clock      =   Clock()
+
         # define subscribers and publishers
         self.trajectory_midpoint_publisher  =   self.create_publisher(          # Centroid publisher
                     TrajectorySetpoint,
@@ -62,19 +103,22 @@ class OffboardMission(Node):
                 VehicleStatus,
                 f'{self.ns}/fmu/out/vehicle_status',
                 partial(self.vehicle_status_callback,id=i),                             # instead of lambda function lambda msg: self.vehicle_status_callback(msg,id=i), use partial function
-                qos_profile_sub)
+                qos_profile_sub,
+                callback_group=self.sub_cb_group)
 
             self.array_subscribers[i]['local_pos_sub']  =   self.create_subscription(
                 VehicleLocalPosition,
                 f'{self.ns}/fmu/out/vehicle_local_position',
                 partial(self.local_position_callback,id=i),
-                qos_profile_sub)
+                qos_profile_sub,
+                callback_group=self.sub_cb_group)
 
             self.array_subscribers[i]['global_pos_sub'] =   self.create_subscription(
                 VehicleGlobalPosition,
                 f'{self.ns}/fmu/out/vehicle_global_position',
                 partial(self.global_position_callback,id=i),
-                qos_profile_sub)
+                qos_profile_sub,
+                callback_group=self.sub_cb_group)
 
             self.array_publishers[i]['offboard_mode_pub']   =   self.create_publisher(
                 OffboardControlMode,
@@ -91,9 +135,35 @@ class OffboardMission(Node):
                 f'{self.ns}/fmu/in/vehicle_command',
                 qos_profile_pub)
 
+        # preallocated messages reused by the publish helpers; the static fields
+        # are filled once here and only the per-publish fields are mutated
+        self.ocm_msg_list   =   []
+        self.tsp_msg_list   =   []
+        for i in range(self.N_drone):
+            ocm_msg                 =   OffboardControlMode()
+            ocm_msg.position        =   True
+            ocm_msg.velocity        =   False
+            ocm_msg.acceleration    =   False
+            ocm_msg.attitude        =   False
+            ocm_msg.body_rate       =   False
+            self.ocm_msg_list.append(ocm_msg)
+            self.tsp_msg_list.append(TrajectorySetpoint())
+
+        # bind the publish methods once: each helper call otherwise walks a
+        # list index, a dict lookup and an attribute load on every tick
+        self.pub_ocm_list   =   [pubs['offboard_mode_pub'].publish for pubs in self.array_publishers]
+        self.pub_traj_list  =   [pubs['trajectory_pub'].publish for pubs in self.array_publishers]
+        self.pub_cmd_list   =   [pubs['vehicle_command_pub'].publish for pubs in self.array_publishers]
+
+        # prebuilt vehicle-command templates shared by all drones
+        self.cmd_offboard_mode  =   self.make_vehicle_command(VehicleCommand.VEHICLE_CMD_DO_SET_MODE,1.0,6.0)
+        self.cmd_arm            =   self.make_vehicle_command(VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM,1.0)
+        self.cmd_auto_land      =   self.make_vehicle_command(VehicleCommand.VEHICLE_CMD_DO_SET_MODE,1.0,4.0,5.0)
+
         # parameters for callback
         self.timer_period   =   0.02            # [sec] callback function frequency
-        self.timer          =   self.create_timer(self.timer_period, self.cmdloop_callback)
+        self.timer          =   self.create_timer(self.timer_period, self.cmdloop_callback,
+                                                  callback_group=self.timer_cb_group)
 
         # define formation config
         self.formation      =   formation_config
@@ -103,9 +173,8 @@ class OffboardMission(Node):
         self.waypoint_idx   =   [0 for _ in range(self.N_drone)]
 
         self.waypoints_lla  =   waypoints
-        self.waypoints_ned  =   navpy.lla2ned(self.waypoints_lla[:,0], self.waypoints_lla[:,1],self.waypoints_lla[:,2],
-                                              self.ref_lla[0], self.ref_lla[1], self.ref_lla[2],
-                                              latlon_unit='deg', alt_unit='m', model='wgs84')
+        self.waypoints_ned  =   lla2ned(self.waypoints_lla[:,0], self.waypoints_lla[:,1],self.waypoints_lla[:,2],
+                                        self.ref_lla[0], self.ref_lla[1], self.ref_lla[2])
 
         self.wpt_set_list   =   [None for _ in range(self.N_drone)]
 
@@ -116,35 +185,58 @@ class OffboardMission(Node):
             self.wpt_set_list[i][:,2]   +=  self.formation[i,2]
 
         # formation flight parameter initialization
-        self.velocity           =   np.float64(4.0)     # [m/s] velocity of the vehicle
+        self.velocity           =   4.0                 # [m/s] velocity of the vehicle
         self.arm_counter_list   =   [0 for i in range(self.N_drone)]
-        self.wpt_idx_list       =   np.array([np.int8(0) for _ in range(self.N_drone)])
+        self.armed_list         =   [False for _ in range(self.N_drone)]
+        self.wpt_idx_list       =   [0 for _ in range(self.N_drone)]
         self.nav_wpt_reach_rad  =   1.0*self.velocity   # [m] waypoint reach condition radius
+        self.nav_wpt_reach_rad_sq   =   self.nav_wpt_reach_rad**2
 
         # variables for subscribing navigation information
         self.nav_state_list         =   [VehicleStatus.NAVIGATION_STATE_MAX for _ in range(self.N_drone)]
-        self.local_pos_ned_list     =   [None for _ in range(self.N_drone)]
-        self.local_pos_ned_valid    =   [None for _ in range(self.N_drone)]
+        self.local_pos_ned_list     =   [np.zeros(3,dtype=np.float64) for _ in range(self.N_drone)]
+        self.local_pos_ned_valid    =   [False for _ in range(self.N_drone)]
+        self.local_pos_skip         =   [False for _ in range(self.N_drone)]
         self.global_ref_lla_list    =   [None for _ in range(self.N_drone)]
         self.global_ref_lla_valid   =   [None for _ in range(self.N_drone)]
 
         self.prev_wpt_list      =   []
         self.next_wpt_list      =   []
-        self.trajectory_set_pt  =   []
         self.yaw_set_pt         =   []
         for i in range(self.N_drone):
             self.prev_wpt_list.append(np.array([0,0,0],dtype=np.float64))
             self.next_wpt_list.append(np.array([0,0,0],dtype=np.float64))
-            self.trajectory_set_pt.append(np.array([0,0,0],dtype=np.float64))
-            self.yaw_set_pt.append(np.array(0.0,dtype=np.float64))
+            self.yaw_set_pt.append(0.0)
+
+        # views into the cached TrajectorySetpoint position buffers (rosidl
+        # exposes fixed-size float arrays as numpy): the interpolation kernel
+        # writes straight into the message memory, so publishing needs no copy
+        self.trajectory_set_pt  =   [np.asarray(msg.position) for msg in self.tsp_msg_list]
 
         # variables for initialization
         self.entry_execute      =   [False for _ in range(self.N_drone)]
         self.ned_spawn_offset   =   [None for _ in range(self.N_drone)]
-        self.flight_phase       =   [np.int8(0) for _ in range(self.N_drone)]
+        self.flight_phase       =   [0 for _ in range(self.N_drone)]
         self.next_phase_flag    =   [False for _ in range(self.N_drone)]
+
+        # flight-phase dispatch table; a new phase only needs a new handler here
+        self.phase_handlers     =   {0: self.run_phase_init,
+                                     1: self.run_phase_mission,
+                                     2: self.run_phase_land}
         self.wpt_change_flag    =   [False for _ in range(self.N_drone)]
-        self.omega              =   np.float64(0.0)
+        self.omega              =   0.0
+        self.omega_step         =   0.0
+
+        # per-segment interpolation terms, recomputed only on waypoint change
+        self.seg_delta_list     =   []
+        self.seg_bias_list      =   []
+        self.seg_min_list       =   []
+        self.seg_max_list       =   []
+        for i in range(self.N_drone):
+            self.seg_delta_list.append(np.array([0,0,0],dtype=np.float64))
+            self.seg_bias_list.append(np.array([0,0,0],dtype=np.float64))
+            self.seg_min_list.append(np.array([0,0,0],dtype=np.float64))
+            self.seg_max_list.append(np.array([0,0,0],dtype=np.float64))
         
         # attack vector
         self.attack_vector      =   []
@@ -155,20 +247,54 @@ class OffboardMission(Node):
         self.attack_vector[4]   =   self.formation[3,:]-self.formation[4,:]
         self.attack_vector[2]   =   3*self.formation[2,:]
 
-        self.attack_duration    =   np.float64(10.0)
-        self.attack_timer       =   np.float64(0.0)
+        self.attack_duration    =   10.0
+        self.attack_timer       =   0.0
+
+    def now_us(self):
+        # current time in microseconds; pure integer path, bit-exact for any
+        # uptime (float division starts losing ns precision past 2**53)
+        return self.clock.now().nanoseconds // 1000
 
     # subscriber callback
     def vehicle_status_callback(self,msg,id):
         self.nav_state_list[id] = msg.nav_state
 
     def local_position_callback(self,msg,id):
-        self.local_pos_ned_list[id]     =   np.array([msg.x,msg.y,msg.z],dtype=np.float64)
+        # client-side decimation: PX4 can publish local position faster than
+        # the command loop consumes it, and rclpy exposes no content-filtered
+        # topics, so every other sample is dropped before any work is done
+        if self.local_pos_skip[id]:
+            self.local_pos_skip[id]     =   False
+            return
+        self.local_pos_skip[id]         =   True
+
+        # write into the preallocated buffer instead of allocating a new array
+        # on every position message
+        pos     =   self.local_pos_ned_list[id]
+        pos[0]  =   msg.x
+        pos[1]  =   msg.y
+        pos[2]  =   msg.z
+        self.local_pos_ned_valid[id]    =   True
 
     def global_position_callback(self,msg,id):
         self.global_ref_lla_list[id]    =   np.array([msg.lat,msg.lon,msg.alt],dtype=np.float64)
 
-    def publish_vehicle_command(self,command,id,param1=0.0,param2=0.0,param3=0.0):
+    def update_segment(self,id):
+        # precompute the interpolation terms of the new segment once so that the
+        # timer callback only evaluates prev+delta*omega instead of rebuilding them
+        delta                   =   self.next_wpt_list[id]-self.prev_wpt_list[id]
+        norm                    =   np.linalg.norm(delta)
+        self.seg_delta_list[id] =   delta
+        self.seg_bias_list[id]  =   0.3*self.velocity*delta/norm
+        self.seg_min_list[id]   =   np.minimum(self.prev_wpt_list[id],self.next_wpt_list[id])
+        self.seg_max_list[id]   =   np.maximum(self.prev_wpt_list[id],self.next_wpt_list[id])
+
+        if id == 0:
+            self.omega_step     =   float(self.timer_period*self.velocity/norm)
+
+    def make_vehicle_command(self,command,param1=0.0,param2=0.0,param3=0.0):
+        # command template: the invariant fields are filled once here and only
+        # the timestamp is stamped per publish
         msg                     =   VehicleCommand()
         msg.param1              =   param1
         msg.param2              =   param2
@@ -179,32 +305,138 @@ class OffboardMission(Node):
         msg.source_system       =   1           # system sending the command
         msg.source_component    =   1           # component sending the command
         msg.from_external       =   True
-        msg.timestamp           =   int(Clock().now().nanoseconds / 1000) # time in microseconds
-        self.array_publishers[id]['vehicle_command_pub'].publish(msg)
+        return msg
+
+    def publish_command(self,msg,id):
+        msg.timestamp           =   self.now_us()
+        self.pub_cmd_list[id](msg)
+
+    def set_offboard_mode(self,id):
+        self.publish_command(self.cmd_offboard_mode,id)
+
+    def arm(self,id):
+        self.publish_command(self.cmd_arm,id)
+
+    def set_auto_land(self,id):
+        self.publish_command(self.cmd_auto_land,id)
 
     def publish_offboard_control_mode(self,id):
-        msg                     =   OffboardControlMode()
-        msg.timestamp           =   int(Clock().now().nanoseconds/1000)
-        msg.position            =   True
-        msg.velocity            =   False
-        msg.acceleration        =   False
-        msg.attitude            =   False
-        msg.body_rate           =   False
-        self.array_publishers[id]['offboard_mode_pub'].publish(msg)
+        msg                     =   self.ocm_msg_list[id]
+        msg.timestamp           =   self.now_us()
+        self.pub_ocm_list[id](msg)
 
     def publish_trajectory_setpoint(self,id):
-        msg                     =   TrajectorySetpoint()
-        msg.timestamp           =   int(Clock().now().nanoseconds/1000)
-        msg.position            =   np.array(self.trajectory_set_pt[id],dtype=np.float32)
+        # position is already in place: trajectory_set_pt[id] is a view into
+        # this message's buffer
+        msg                     =   self.tsp_msg_list[id]
+        msg.timestamp           =   self.now_us()
         msg.yaw                 =   float(self.yaw_set_pt[id])
-        self.array_publishers[id]['trajectory_pub'].publish(msg)
+        self.pub_traj_list[id](msg)
     
     def publish_trajectory_centroid(self):
         msg                     =   TrajectorySetpoint()
-        msg.timestamp           =   int(Clock().now().nanoseconds/1000)
+        msg.timestamp           =   self.now_us()
         msg.position            =   np.array(self.trajectory_centroid,dtype=np.float32)
         msg.yaw                 =   float(self.yaw_set_pt[id])
-        self.array_publishers[id]['trajectory_pub'].publish(msg)
+        self.pub_traj_list[id](msg)
+
+    def run_interp(self,id,attack_t=0.0):
+        # shared interpolation step over the terms precomputed by update_segment();
+        # JIT-compiled by numba when available
+        interp_kernel(self.prev_wpt_list[id],self.seg_delta_list[id],self.seg_bias_list[id],
+                      self.seg_min_list[id],self.seg_max_list[id],self.omega,
+                      self.attack_vector[id],attack_t,self.trajectory_set_pt[id])
+
+    def sq_dist_to_next(self,id,attack_t=0.0):
+        # squared distance between the vehicle and its current waypoint target
+        return sq_dist_kernel(self.next_wpt_list[id],self.local_pos_ned_list[id],
+                              self.attack_vector[id],attack_t)
+
+    def run_phase_init(self,idx):
+
+        # entry:
+        # compensation of local position coordinate
+        if self.global_ref_lla_list[idx] is not None and self.local_pos_ned_valid[idx] and self.entry_execute[idx] is False:
+            self.ned_spawn_offset[idx]  =   lla2ned(self.global_ref_lla_list[idx][0],self.global_ref_lla_list[idx][1],0,
+                                                    self.ref_lla[0],self.ref_lla[1],self.ref_lla[2])
+
+            self.wpt_set_list[idx][:,0] -=  self.ned_spawn_offset[idx][0]
+            self.wpt_set_list[idx][:,1] -=  self.ned_spawn_offset[idx][1]
+            self.wpt_set_list[idx][:,2] -=  self.ned_spawn_offset[idx][2]
+
+            self.trajectory_set_pt[idx][:]  =   (0.0,0.0,-5.0)
+            self.yaw_set_pt[idx]        =   self.yaw_set_pt[idx]
+
+            self.prev_wpt_list[idx]     =   np.copy(self.local_pos_ned_list[idx])
+            self.next_wpt_list[idx]     =   self.trajectory_set_pt[idx].astype(np.float64)
+
+            self.publish_trajectory_setpoint(idx)
+
+            self.entry_execute[idx]     =   True
+
+        # during: send the mode/arm burst a fixed number of times, then latch
+        # the flag so the comparisons and the two publishes leave the tick path
+        if not self.armed_list[idx]:
+            self.set_offboard_mode(idx)
+            self.arm(idx)
+            self.arm_counter_list[idx]  +=  1
+            if self.arm_counter_list[idx] >= 20:
+                self.armed_list[idx]    =   True
+                self.get_logger().info('Drone #'+str(idx+1)+' armed and dangerous....')
+
+        if self.entry_execute[idx] is True:
+            self.publish_offboard_control_mode(idx)
+            self.publish_trajectory_setpoint(idx)
+
+            if self.sq_dist_to_next(idx) < 1.0:
+                self.next_phase_flag[idx]   =   True
+
+    def run_phase_mission(self,idx):
+
+        # entry:
+        if self.entry_execute[idx] is False:
+            self.prev_wpt_list[idx]     =   np.copy(self.next_wpt_list[idx])
+            self.next_wpt_list[idx]     =   np.copy(self.wpt_set_list[idx][self.wpt_idx_list[idx],:])
+            self.omega                  =   0.0
+            self.update_segment(idx)
+
+            self.run_interp(idx)
+            self.yaw_set_pt[idx]        =   self.yaw_set_pt[idx]
+
+            self.publish_offboard_control_mode(idx)
+            self.publish_trajectory_setpoint(idx)
+
+            self.entry_execute[idx]     =   True
+
+        # during:
+        if self.entry_execute[idx] is True:
+            self.run_interp(idx,self.attack_timer)
+            self.yaw_set_pt[idx]        =   self.yaw_set_pt[idx]
+
+            self.publish_offboard_control_mode(idx)
+            self.publish_trajectory_setpoint(idx)
+
+            # transition:
+            if self.sq_dist_to_next(idx,self.attack_timer) < self.nav_wpt_reach_rad_sq:
+                if self.wpt_idx_list[idx] < np.shape(self.wpt_set_list[idx])[0]-1:
+                    self.wpt_change_flag[idx]   =   True
+                else:
+                    self.next_phase_flag[idx]   =   True
+
+        if idx == 0 and self.wpt_idx_list[idx] >= 6:
+            self.attack_timer   =   min(self.attack_timer+self.timer_period/self.attack_duration,1.0)
+            # throttled: the logger skips formatting entirely while suppressed
+            self.get_logger().info('C2 Link Hijacking',throttle_duration_sec=1.0)
+
+        if idx == 0 and self.wpt_idx_list[idx] >= 7:
+            self.attack_timer   =   0.0
+
+        if idx == 0:
+            self.omega      =   min(self.omega+self.omega_step,1.0)
+
+    def run_phase_land(self,idx):
+
+        self.set_auto_land(idx)
 
     def cmdloop_callback(self):
 
@@ -212,149 +444,35 @@ class OffboardMission(Node):
         #TODO
 
         # Publish Set of Trajectories
-        for idx in range(self.N_drone): 
-
-            if self.flight_phase[idx] == 0:
-
-                # entry:
-                # compensation of local position coordinate
-                if self.global_ref_lla_list[idx] is not None and self.local_pos_ned_list[idx] is not None and self.entry_execute[idx] is False:
-                    self.ned_spawn_offset[idx]  =   navpy.lla2ned(self.global_ref_lla_list[idx][0],self.global_ref_lla_list[idx][1],0,
-                                                                self.ref_lla[0],self.ref_lla[1],self.ref_lla[2],
-                                                                latlon_unit='deg', alt_unit='m', model='wgs84')
-
-                    self.wpt_set_list[idx][:,0] -=  self.ned_spawn_offset[idx][0]
-                    self.wpt_set_list[idx][:,1] -=  self.ned_spawn_offset[idx][1]
-                    self.wpt_set_list[idx][:,2] -=  self.ned_spawn_offset[idx][2]
-
-                    self.trajectory_set_pt[idx] =   np.array([0.0,0.0,-5.0],dtype=np.float64)
-                    self.yaw_set_pt[idx]        =   self.yaw_set_pt[idx]
-
-                    self.prev_wpt_list[idx]     =   np.copy(self.local_pos_ned_list[idx])
-                    self.next_wpt_list[idx]     =   np.copy(self.trajectory_set_pt[idx])
-
-                    self.publish_trajectory_setpoint(idx)
-
-                    self.entry_execute[idx]     =   True
-
-                # during:
-                if self.nav_state_list[idx] != VehicleStatus.ARMING_STATE_ARMED or self.arm_counter_list[idx] < 20:
-                    self.publish_vehicle_command(VehicleCommand.VEHICLE_CMD_DO_SET_MODE,idx,1.0,6.0)
-                    self.publish_vehicle_command(VehicleCommand.VEHICLE_CMD_COMPONENT_ARM_DISARM,idx,1.0)
-                    self.arm_counter_list[idx]  +=  1
-                    # self.get_logger().info('Drone #'+str(idx+1)+' armed and dangerous....')
-
-                if self.entry_execute[idx] is True:
-                    self.publish_offboard_control_mode(idx)
-                    self.publish_trajectory_setpoint(idx)
-
-                    if np.linalg.norm(self.next_wpt_list[idx]-self.local_pos_ned_list[idx]) < 1.0:
-                        self.next_phase_flag[idx]   =   True
-
-            elif self.flight_phase[idx] == 1:
-                # entry:
-                if self.entry_execute[idx] is False:
-                    self.prev_wpt_list[idx]     =   np.copy(self.next_wpt_list[idx])
-                    self.next_wpt_list[idx]     =   np.copy(self.wpt_set_list[idx][self.wpt_idx_list[idx],:])
-                    self.omega                  =   np.float64(0.0)
-
-                    norm        =   np.linalg.norm(self.next_wpt_list[idx]-self.prev_wpt_list[idx])
-                    self.trajectory_set_pt[idx][0]  =   np.clip((1-self.omega)*self.prev_wpt_list[idx][0] \
-                                                                +self.omega*self.next_wpt_list[idx][0] \
-                                                                +0.3*self.velocity*(self.next_wpt_list[idx][0]-self.prev_wpt_list[idx][0])/norm, \
-                                                                np.min(np.array([self.prev_wpt_list[idx][0], self.next_wpt_list[idx][0]])), \
-                                                                np.max(np.array([self.prev_wpt_list[idx][0], self.next_wpt_list[idx][0]])))                          
-                    self.trajectory_set_pt[idx][1]  =   np.clip((1-self.omega)*self.prev_wpt_list[idx][1] \
-                                                                +self.omega*self.next_wpt_list[idx][1] \
-                                                                +0.3*self.velocity*(self.next_wpt_list[idx][1]-self.prev_wpt_list[idx][1])/norm, \
-                                                                np.min(np.array([self.prev_wpt_list[idx][1], self.next_wpt_list[idx][1]])), \
-                                                                np.max(np.array([self.prev_wpt_list[idx][1], self.next_wpt_list[idx][1]])))
-                    self.trajectory_set_pt[idx][2]  =   np.clip((1-self.omega)*self.prev_wpt_list[idx][2] \
-                                                                +self.omega*self.next_wpt_list[idx][2] \
-                                                                +0.3*self.velocity*(self.next_wpt_list[idx][2]-self.prev_wpt_list[idx][2])/norm, \
-                                                                np.min(np.array([self.prev_wpt_list[idx][2], self.next_wpt_list[idx][2]])), \
-                                                                np.max(np.array([self.prev_wpt_list[idx][2], self.next_wpt_list[idx][2]])))
-                    self.yaw_set_pt[idx]        =   self.yaw_set_pt[idx]
-
-                    self.publish_offboard_control_mode(idx)
-                    self.publish_trajectory_setpoint(idx)
-
-                    self.entry_execute[idx]     =   True
-
-                if self.entry_execute[idx] is True:
-                    norm        =   np.linalg.norm(self.next_wpt_list[idx]-self.prev_wpt_list[idx])
-                    self.trajectory_set_pt[idx][0]  =   np.clip((1-self.omega)*self.prev_wpt_list[idx][0] \
-                                                                +self.omega*self.next_wpt_list[idx][0] \
-                                                                +0.3*self.velocity*(self.next_wpt_list[idx][0]-self.prev_wpt_list[idx][0])/norm, \
-                                                                np.min(np.array([self.prev_wpt_list[idx][0], self.next_wpt_list[idx][0]])), \
-                                                                np.max(np.array([self.prev_wpt_list[idx][0], self.next_wpt_list[idx][0]]))) \
-                                                        +self.attack_vector[idx][0]*self.attack_timer
-
-                    self.trajectory_set_pt[idx][1]  =   np.clip((1-self.omega)*self.prev_wpt_list[idx][1] \
-                                                                +self.omega*self.next_wpt_list[idx][1] \
-                                                                +0.3*self.velocity*(self.next_wpt_list[idx][1]-self.prev_wpt_list[idx][1])/norm, \
-                                                                np.min(np.array([self.prev_wpt_list[idx][1], self.next_wpt_list[idx][1]])), \
-                                                                np.max(np.array([self.prev_wpt_list[idx][1], self.next_wpt_list[idx][1]]))) \
-                                                        +self.attack_vector[idx][1]*self.attack_timer    
-                    self.trajectory_set_pt[idx][2]  =   np.clip((1-self.omega)*self.prev_wpt_list[idx][2] \
-                                                                +self.omega*self.next_wpt_list[idx][2] \
-                                                                +0.3*self.velocity*(self.next_wpt_list[idx][2]-self.prev_wpt_list[idx][2])/norm, \
-                                                                np.min(np.array([self.prev_wpt_list[idx][2], self.next_wpt_list[idx][2]])), \
-                                                                np.max(np.array([self.prev_wpt_list[idx][2], self.next_wpt_list[idx][2]]))) \
-                                                        +self.attack_vector[idx][2]*self.attack_timer    
-                                 
-                    self.yaw_set_pt[idx]        =   self.yaw_set_pt[idx]
-
-                    self.publish_offboard_control_mode(idx)
-                    self.publish_trajectory_setpoint(idx)
-
-                    if np.linalg.norm(self.next_wpt_list[idx]-self.local_pos_ned_list[idx]+self.attack_vector[idx]*self.attack_timer) < self.nav_wpt_reach_rad and self.wpt_idx_list[idx] < np.shape(self.wpt_set_list[idx])[0]-1:
-                        self.wpt_change_flag[idx]   =   True
-
-                    elif np.linalg.norm(self.next_wpt_list[idx]-self.local_pos_ned_list[idx]+self.attack_vector[idx]*self.attack_timer) < self.nav_wpt_reach_rad and self.wpt_idx_list[idx] == np.shape(self.wpt_set_list[idx])[0]-1:
-                        self.next_phase_flag[idx]   =   True
-
-                if idx == 0 and self.wpt_idx_list[idx] >= 6:
-                    self.attack_timer   =   np.clip(self.attack_timer+self.timer_period/self.attack_duration,0,1)
-                    print('C2 Link Hijacking')
-
-                if idx == 0 and self.wpt_idx_list[idx] >= 7:
-                    self.attack_timer   =   np.float64(0.0)
-
-                if idx == 0:
-                    norm_delt       =   np.linalg.norm(self.next_wpt_list[idx]-self.prev_wpt_list[idx])/self.velocity
-                    self.omega      =   self.omega+self.timer_period/norm_delt
-                    self.omega      =   np.clip(self.omega,0,1)
-
-            elif self.flight_phase[idx] == 2:
-                   
-                self.publish_vehicle_command(VehicleCommand.VEHICLE_CMD_DO_SET_MODE,idx,1.0,4.0,5.0)
+        for idx in range(self.N_drone):
+
+            handler     =   self.phase_handlers.get(self.flight_phase[idx])
 
+            if handler is not None:
+                handler(idx)
 
         if all(self.next_phase_flag):
             self.flight_phase       =   [self.flight_phase[idx]+1 for idx in range(self.N_drone)]
             self.next_phase_flag    =   [False for _ in range(self.N_drone)]
             self.entry_execute      =   [False for _ in range(self.N_drone)]
-            print('Next Flight Phase')
+            self.get_logger().info('Next Flight Phase')
 
         if all(self.wpt_change_flag):
 
-            self.omega                  =   np.float64(0.0)
+            self.omega                  =   0.0
 
             for idx in range(self.N_drone):
                 self.wpt_idx_list[idx]      =   self.wpt_idx_list[idx]+1
                 self.prev_wpt_list[idx]     =   np.copy(self.next_wpt_list[idx])
                 self.next_wpt_list[idx]     =   np.copy(self.wpt_set_list[idx][self.wpt_idx_list[idx],:])
                 self.wpt_change_flag[idx]   =   False
+                self.update_segment(idx)
 
-            print('Waypoint Update: '+str(self.wpt_idx_list[0]))
+            self.get_logger().info('Waypoint Update: %d' % self.wpt_idx_list[0])
 
         
 
 def main():
-    # parser = argparse.ArgumentParser()
-    # parser.add_argument('-n', type=int)
-    # args = parser.parse_args()
 
     N_drone     =   6
     ref_lla     =   np.array([24.484043629238872, 54.36068616768677, 0])    # (lat,lon,alt) -> (deg,deg,m)
@@ -384,7 +502,11 @@ def main():
 
     offboard_mission = OffboardMission(N_drone,WPTs,Formation,ref_lla)
 
-    rclpy.spin(offboard_mission)
+    # one thread services the subscriptions, the other keeps the 50 Hz
+    # command-loop timer on schedule
+    executor = MultiThreadedExecutor(num_threads=2)
+    executor.add_node(offboard_mission)
+    executor.spin()
 
     offboard_mission.destroy_node()
 
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+"""Regenerates the WAYPOINTS_NED literal in offboard_control_sitl.py.
+
+The mission waypoints and the Gazebo model origin are compile-time constants,
+so the LLA -> NED conversion is done here once instead of at every node
+start-up. Paste the printed rows over the existing table.
+"""
+
+import numpy as np
+
+from px4_offboard.geodesy import lla2ned
+
+# Gazebo Model Origin
+LLA_REF = np.array([24.484043629238872, 54.36068616768677, 0])  # (deg,deg,m)
+
+WAYPOINTS_LLA = np.array([
+    [24.484326113268185, 54.360644616972564, 30],
+    [24.48476311664666, 54.3614948536716, 30],
+    [24.485097533474377, 54.36197496905472, 30],
+    [24.485400216562002, 54.3625570084458, 30],
+    [24.48585179883862, 54.36321951405934, 30],
+    [24.486198417650844, 54.363726451568475, 30],
+    [24.486564563238797, 54.36423338904003, 0],
+])
+
+
+def main():
+    ned = lla2ned(WAYPOINTS_LLA[:, 0], WAYPOINTS_LLA[:, 1], WAYPOINTS_LLA[:, 2],
+                  LLA_REF[0], LLA_REF[1], LLA_REF[2])
+    print("WAYPOINTS_NED = np.array([")
+    for row in ned:
+        print("    [%.6f, %.6f, %.6f]," % tuple(row))
+    print("])")
+
+
+if __name__ == '__main__':
+    main()